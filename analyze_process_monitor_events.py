@@ -37,8 +37,20 @@ The arguments are
 Notice the Windows path has double slashes, and notice by the third argument
 that this program can run on Unix-style systems.
 
+To combine traces from several machines, pass the same --db index.sqlite
+with each trace. Each trace is parsed once and added to the index, and the
+whitelist is built from every trace in the index. With --min-traces K, the
+whitelist keeps only paths touched by at least K traces.
+
 """
 
+import csv
+import functools
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
 
 
 def list_to_file(l, fn):
@@ -63,61 +75,822 @@ def clean_filename(fn, base_path):
 
     return ret
 
+class PathNormalizer:
+    """Standardize filenames relative to one base path
+
+    For paths under the base path, this gives the same result as
+    clean_filename(), but the lowercase variants of the base path are
+    computed once, the base path is stripped as a prefix in one step,
+    and recent results are cached.
+    """
+
+    def __init__(self, base_path, cache_size=1 << 16):
+        prefixes = [base_path.lower(), base_path.replace('/', '\\').lower()]
+        self.prefixes = tuple(sorted(set(p for p in prefixes if p),
+                                     key=len, reverse=True))
+        self.normalize = functools.lru_cache(maxsize=cache_size)(self._normalize)
+
+    def __call__(self, fn):
+        return self.normalize(fn)
+
+    def _normalize(self, fn):
+        if '/' == fn[0]:
+            # running on Unix-like system
+            fn = fn.replace('/', '\\')
+        ret = fn.lower()
+        for prefix in self.prefixes:
+            if ret.startswith(prefix):
+                ret = ret[len(prefix):]
+                break
+        if ret.endswith('\\*'):
+            # remove wildcard seen with QueryDirectory
+            ret = ret[:-1]
+        return ret
+
+
 def is_filtered(path):
-    if path.lower().startswith('hk'):
+    prefix = path[:11].lower()
+    if prefix.startswith('hk'):
         # registry keys: HKCU, HKLM
         return True
-    if path.lower().startswith('c:\\windows\\'):
+    if prefix == 'c:\\windows\\':
         return True
     return False
 
-def get_whitelist(csv_path, base_path):
-    whitelist = set()
+# Read the trace in large blocks rather than line by line.
+CHUNK_SIZE = 4 * 1024 * 1024
 
-    import csv
-    with open(csv_path, newline='') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if not 'SUCCESS' == row[5]:
-                continue
-            fn_raw = row[4]
-            if is_filtered(fn_raw):
-                continue
-            fn_clean = clean_filename(fn_raw, base_path)
-            whitelist.add(fn_clean)
+
+def iter_rows(csv_path, stats, start=0, end=None, required=b'SUCCESS'):
+    """Yield the rows of the trace as lists of fields
+
+    The trace is read in large blocks, and lines that do not contain
+    the bytes in required are dropped before the CSV module builds a
+    row for them, so memory use does not depend on the size of the trace.
+    With required=None, every row is yielded.
+
+    Only the byte range [start, end) is read, and it must begin and end
+    on record boundaries.
+
+    stats['rows'] is incremented by the number of lines read.
+    """
+    def parse_lines(lines):
+        stats['rows'] += len(lines)
+        candidates = [line.decode('utf-8', 'replace')
+                      for line in lines if required is None or required in line]
+        for row in csv.reader(candidates):
+            if len(row) > 5:
+                yield row
+
+    with open(csv_path, 'rb') as f:
+        if end is None:
+            end = os.fstat(f.fileno()).st_size
+        f.seek(start)
+        remaining = end - start
+        tail = b''
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop()
+            yield from parse_lines(lines)
+        if tail:
+            yield from parse_lines([tail])
+
+
+def iter_success_paths(csv_path, stats, start=0, end=None):
+    """Yield the raw path of each SUCCESS row in the trace"""
+    for row in iter_rows(csv_path, stats, start, end):
+        if 'SUCCESS' == row[5]:
+            yield row[4]
+
+
+def split_trace(csv_path, parts):
+    """Split the trace into byte ranges that begin on record boundaries
+
+    Returns a list of (start, end) tuples covering the whole file.
+    """
+    size = os.path.getsize(csv_path)
+    bounds = [0]
+    with open(csv_path, 'rb') as f:
+        for i in range(1, parts):
+            # Start from the byte before the nominal offset, so an offset
+            # that is already at the start of a line is kept.
+            f.seek(max(size * i // parts - 1, 0))
+            f.readline()
+            bound = min(f.tell(), size)
+            if bound > bounds[-1]:
+                bounds.append(bound)
+    bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)
+            if bounds[i] < bounds[i + 1]]
+
+
+def build_partial_whitelist(csv_path, base_path, start=0, end=None):
+    """Build the whitelist for one byte range of the trace
+
+    Returns a tuple (whitelist, rows read), where the whitelist is a
+    Counter of accesses per cleaned path.
+    """
+    whitelist = Counter()
+    normalize = PathNormalizer(base_path)
+    stats = {'rows': 0}
+    for fn_raw in iter_success_paths(csv_path, stats, start, end):
+        if is_filtered(fn_raw):
+            continue
+        whitelist[normalize(fn_raw)] += 1
+    return (whitelist, stats['rows'])
+
+
+def build_partial_events(csv_path, start=0, end=None):
+    """Count each (operation, result, raw path) in one byte range of the trace
+
+    Returns a tuple (events, rows read).
+    """
+    events = Counter()
+    stats = {'rows': 0}
+    for row in iter_rows(csv_path, stats, start, end, required=None):
+        events[(row[3], row[5], row[4])] += 1
+    return (events, stats['rows'])
+
+
+def run_sharded(func, csv_path, args, jobs):
+    """Run func(csv_path, *args, start, end) over the trace and merge the results
+
+    func returns a tuple (Counter, rows read). With jobs > 1, the trace
+    is split into byte ranges that are analyzed by separate processes.
+    """
+    if jobs <= 1:
+        return func(csv_path, *args)
+    from multiprocessing import Pool
+    ranges = split_trace(csv_path, jobs)
+    with Pool(min(jobs, len(ranges))) as pool:
+        results = pool.starmap(
+            func, [(csv_path,) + tuple(args) + r for r in ranges])
+    merged = Counter()
+    rows = 0
+    for (partial, partial_rows) in results:
+        merged.update(partial)
+        rows += partial_rows
+    return (merged, rows)
+
+
+# Layout of the trace cache: magic, header length, JSON header, then one
+# array per column, each padded to a multiple of 8 bytes
+TRACE_CACHE_MAGIC = b'BBPMC001'
+TRACE_CACHE_COLUMNS = (('operation', 'I'), ('result', 'I'), ('path', 'I'), ('count', 'Q'))
+
+
+def hash_file(path):
+    """Return the BLAKE2b digest of a file"""
+    import hashlib
+    h = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_trace_cache(cache_path, key, events, rows):
+    """Write the event counts of a trace to a columnar cache file
+
+    Operations, results, and raw paths are interned into tables in the
+    header, and the columns hold their indexes.
+    """
+    import array
+    import json
+    import struct
+    tables = {'operation': {}, 'result': {}, 'path': {}}
+    columns = {name: array.array(typecode) for (name, typecode) in TRACE_CACHE_COLUMNS}
+    for ((operation, result, path), count) in events.items():
+        for (name, value) in (('operation', operation), ('result', result), ('path', path)):
+            columns[name].append(tables[name].setdefault(value, len(tables[name])))
+        columns['count'].append(count)
+    header = dict(key, rows=rows, events=len(events))
+    header.update((name, list(table)) for (name, table) in tables.items())
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(TRACE_CACHE_MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for (name, _typecode) in TRACE_CACHE_COLUMNS:
+            data = columns[name].tobytes()
+            f.write(data + b'\0' * (-len(data) % 8))
+    os.replace(tmp_path, cache_path)
+
+
+class TraceCache:
+    """The columns of a trace cache file, read through a memory map
+
+    tables maps operation, result, and path to their lists of interned
+    values, and columns maps each column name to a memoryview of table
+    indexes or counts. The columns are valid until close().
+    """
+
+    def __init__(self, f, mm, header, columns):
+        self.f = f
+        self.mm = mm
+        self.rows = header['rows']
+        self.tables = {name: header[name] for name in ('operation', 'result', 'path')}
+        self.columns = columns
+
+    @classmethod
+    def open(cls, cache_path, key):
+        """Return the TraceCache, or None if it is missing, stale, or damaged
+
+        The header must match key, and the file must hold every column
+        in full, so a truncated cache is rebuilt instead of silently
+        dropping events.
+        """
+        import array
+        import json
+        import mmap
+        import struct
+        try:
+            f = open(cache_path, 'rb')
+        except FileNotFoundError:
+            return None
+        mm = None
+        columns = {}
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if mm[:8] != TRACE_CACHE_MAGIC:
+                raise ValueError('not a trace cache')
+            (header_len,) = struct.unpack('<Q', mm[8:16])
+            header = json.loads(mm[16:16 + header_len])
+            if any(header.get(k) != v for (k, v) in key.items()):
+                # stale
+                columns = None
+            else:
+                n = header['events']
+                offset = 16 + header_len
+                with memoryview(mm) as view:
+                    for (name, typecode) in TRACE_CACHE_COLUMNS:
+                        size = n * array.array(typecode).itemsize
+                        with view[offset:offset + size] as data:
+                            if len(data) != size:
+                                raise ValueError('column %s is truncated' % name)
+                            columns[name] = data.cast(typecode)
+                        offset += size + (-size % 8)
+                if offset != len(mm):
+                    raise ValueError('expected %d bytes, found %d' % (offset, len(mm)))
+                for name in ('operation', 'result', 'path'):
+                    if not isinstance(header[name], list):
+                        raise ValueError('table %s is not a list' % name)
+                return cls(f, mm, header, columns)
+        except (ValueError, KeyError, TypeError, AttributeError, struct.error) as e:
+            # json.JSONDecodeError is a ValueError
+            print('Ignoring damaged trace cache %s: %s' % (cache_path, e))
+        for column in (columns or {}).values():
+            column.release()
+        if mm is not None:
+            mm.close()
+        f.close()
+        return None
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self.mm.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def count_success_paths(self):
+        """Return a dictionary of raw path to successful accesses, ignoring filtered paths
+
+        SUCCESS is looked up once in the result table and is_filtered()
+        runs once per distinct path, so the columns are scanned as
+        integers and strings are built only for the selected paths.
+        """
+        results = self.tables['result']
+        if 'SUCCESS' not in results:
+            return {}
+        success = results.index('SUCCESS')
+        paths = self.tables['path']
+        keep = bytes(not is_filtered(path) for path in paths)
+        path_counts = [0] * len(paths)
+        for (result, path, count) in zip(self.columns['result'], self.columns['path'],
+                                         self.columns['count']):
+            if result == success and keep[path]:
+                path_counts[path] += count
+        return {paths[i]: count for (i, count) in enumerate(path_counts) if count}
+
+
+def load_trace_events(csv_path, jobs=1):
+    """Return the TraceCache for a trace, from the cache file next to it
+
+    The cache is keyed on the size, modification time, and content hash
+    of the trace. A missing or stale cache is rebuilt from the trace.
+    """
+    cache_path = csv_path + '.cache'
+    st = os.stat(csv_path)
+    key = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if os.path.exists(cache_path):
+        key['blake2b'] = hash_file(csv_path)
+        cache = TraceCache.open(cache_path, key)
+        if cache is not None:
+            print('Loaded parsed trace from %s' % cache_path)
+            return cache
+    (events, rows) = run_sharded(build_partial_events, csv_path, (), jobs)
+    if 'blake2b' not in key:
+        key['blake2b'] = hash_file(csv_path)
+    write_trace_cache(cache_path, key, events, rows)
+    print('Wrote parsed trace to %s' % cache_path)
+    return TraceCache.open(cache_path, key)
+
+
+def get_whitelist(csv_path, base_path, jobs=1, return_rows=False, use_cache=False):
+    """Count the successful accesses to each cleaned path in the trace
+
+    With jobs > 1, the trace is split into byte ranges that are analyzed
+    by separate processes, and their results are merged.
+
+    With use_cache, the parsed trace is kept in a cache file next to the
+    trace, so later runs apply the filters to its columns and the base
+    path to the distinct paths instead of to every row.
+
+    With return_rows, return a tuple (whitelist, rows read).
+    """
+    import time
+    start = time.perf_counter()
+    if use_cache:
+        with load_trace_events(csv_path, jobs) as cache:
+            rows = cache.rows
+            path_counts = cache.count_success_paths()
+        whitelist = Counter()
+        normalize = PathNormalizer(base_path)
+        for (fn_raw, count) in path_counts.items():
+            whitelist[normalize(fn_raw)] += count
+    else:
+        (whitelist, rows) = run_sharded(build_partial_whitelist, csv_path, (base_path,), jobs)
+    elapsed = time.perf_counter() - start
+    print('Read %d rows in %.1f seconds (%.0f rows/second), %d unique paths' %
+          (rows, elapsed, rows / max(elapsed, 1e-9), len(whitelist)))
+    if return_rows:
+        return (whitelist, rows)
     return whitelist
 
 
+class PathTrie:
+    """Cleaned paths stored as a tree of path components
+
+    Each node counts the accesses to its own path (count) and to
+    everything below it (total). A path ending with a backslash, such
+    as a directory listing, is stored under an empty final component.
+    """
+
+    __slots__ = ('children', 'count', 'total')
+
+    def __init__(self):
+        self.children = {}
+        self.count = 0
+        self.total = 0
+
+    @classmethod
+    def from_counts(cls, counts):
+        """Build a trie from a mapping of cleaned path to access count"""
+        trie = cls()
+        for (path, count) in counts.items():
+            trie.add(path, count)
+        return trie
+
+    def add(self, path, count=1):
+        """Record accesses to a cleaned path"""
+        node = self
+        node.total += count
+        for part in path.split('\\'):
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = PathTrie()
+            node = child
+            node.total += count
+        node.count += count
+
+    def find(self, path):
+        """Return the node for a cleaned path, or None"""
+        node = self
+        for part in path.split('\\'):
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def __contains__(self, path):
+        node = self.find(path)
+        return node is not None and node.count > 0
+
 
 def walk_compare_path(compare_path, whitelist):
-    keep = set()
-    remove = set()
-
-    import os
-    for root, dirs, files in os.walk(compare_path, topdown=False):
-        for name in files:
-            full_path = os.path.join(root, name)
-            cleaned_path = clean_filename(full_path, compare_path)
-            if cleaned_path in whitelist:
-                keep.add(cleaned_path)
+    """Classify the files under compare_path as keep or remove
+
+    whitelist is a PathTrie. The tree is read with os.scandir(), and
+    cleaned paths are built one component at a time while descending
+    the trie, so directories that the trace never entered are not
+    looked up file by file.
+
+    Returns a tuple (keep, remove, remove_dirs, folders). keep and remove
+    map each cleaned file path to its size in bytes. remove_dirs holds
+    the topmost directories in which no file is kept, so they can be
+    deleted whole. folders maps each cleaned directory path to a tuple
+    (files kept, files total, accesses, bytes removable) for its subtree.
+    """
+    keep = {}
+    remove = {}
+    remove_dirs = set()
+    folders = {}
+
+    def scan(path, dir_path, node):
+        kept = 0
+        total = 0
+        removable = 0
+        untouched = []
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            entries = []
+        for entry in entries:
+            name = entry.name.lower()
+            child = node.children.get(name) if node is not None else None
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if entry.is_symlink():
+                    # like os.walk(), do not follow links to directories
+                    continue
+                child_path = dir_path + name + '\\'
+                (child_kept, child_total, child_removable) = scan(entry.path, child_path, child)
+                kept += child_kept
+                total += child_total
+                removable += child_removable
+                if child_total and not child_kept:
+                    untouched.append(child_path)
+                continue
+            try:
+                size = entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                size = 0
+            total += 1
+            if child is not None and child.count > 0:
+                keep[dir_path + name] = size
+                kept += 1
             else:
-                remove.add(cleaned_path)
-    return (keep, remove)
+                remove[dir_path + name] = size
+                removable += size
+        if kept:
+            # These are the topmost directories without kept files.
+            remove_dirs.update(untouched)
+        folders[dir_path] = (kept, total, node.total if node else 0, removable)
+        return (kept, total, removable)
+
+    # The cleaned prefix of files directly in compare_path
+    root_path = PathNormalizer(compare_path)(os.path.join(compare_path, 'x'))[:-1]
+    root_node = whitelist.find(root_path[:-1]) if root_path else whitelist
+    scan(compare_path, root_path, root_node)
+    return (keep, remove, remove_dirs, folders)
+
+
+def folders_to_file(folders, fn):
+    """Write the folder coverage statistics to a file"""
+    with open(fn, 'w') as f:
+        for dir_path in sorted(folders):
+            (kept, total, accesses, removable) = folders[dir_path]
+            if not total:
+                continue
+            f.write('%d/%d files kept (%.0f%%), %d bytes removable, %d accesses: %s\n' %
+                    (kept, total, 100. * kept / total, removable, accesses, dir_path))
+
+
+TRACE_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS traces (
+    id INTEGER PRIMARY KEY,
+    csv_path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    base_path TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    UNIQUE (csv_path, size, mtime_ns, base_path)
+);
+CREATE TABLE IF NOT EXISTS paths (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    traces INTEGER NOT NULL DEFAULT 0,
+    accesses INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS paths_traces ON paths (traces);
+CREATE TABLE IF NOT EXISTS hits (
+    trace_id INTEGER NOT NULL REFERENCES traces (id),
+    path_id INTEGER NOT NULL REFERENCES paths (id),
+    count INTEGER NOT NULL,
+    PRIMARY KEY (path_id, trace_id)
+) WITHOUT ROWID;
+"""
+
+
+def open_trace_index(db_path):
+    """Open the SQLite index of traces, creating it if needed"""
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    conn.executescript(TRACE_INDEX_SCHEMA)
+    return conn
+
+
+def update_trace_index(db_path, csv_path, base_path, jobs=1, use_cache=False):
+    """Add the accesses in a trace to the index of traces
+
+    A trace that is already in the index, identified by its path, size,
+    modification time, and base path, is not parsed again. A trace with
+    the same path and base path whose size or modification time changed
+    replaces the old one, so a re-exported trace is not counted twice.
+    """
+    st = os.stat(csv_path)
+    key = (os.path.abspath(csv_path), st.st_size, st.st_mtime_ns, base_path)
+    conn = open_trace_index(db_path)
+    try:
+        if conn.execute('SELECT 1 FROM traces WHERE csv_path = ? AND size = ? '
+                        'AND mtime_ns = ? AND base_path = ?', key).fetchone():
+            print('Trace %s is already in the index' % csv_path)
+            return
+        old_ids = [trace_id for (trace_id,) in conn.execute(
+            'SELECT id FROM traces WHERE csv_path = ? AND base_path = ?', (key[0], key[3]))]
+        (whitelist, rows) = get_whitelist(
+            csv_path, base_path, jobs, return_rows=True, use_cache=use_cache)
+        with conn:
+            for old_id in old_ids:
+                conn.execute(
+                    'UPDATE paths SET traces = traces - 1, accesses = accesses - '
+                    '(SELECT count FROM hits WHERE path_id = paths.id AND trace_id = ?) '
+                    'WHERE id IN (SELECT path_id FROM hits WHERE trace_id = ?)',
+                    (old_id, old_id))
+                conn.execute('DELETE FROM hits WHERE trace_id = ?', (old_id,))
+                conn.execute('DELETE FROM traces WHERE id = ?', (old_id,))
+            if old_ids:
+                conn.execute('DELETE FROM paths WHERE traces = 0')
+            trace_id = conn.execute(
+                'INSERT INTO traces (csv_path, size, mtime_ns, base_path, rows) '
+                'VALUES (?, ?, ?, ?, ?)', key + (rows,)).lastrowid
+            conn.executemany('INSERT OR IGNORE INTO paths (path) VALUES (?)',
+                             ((path,) for path in whitelist))
+            conn.executemany(
+                'UPDATE paths SET traces = traces + 1, accesses = accesses + ? '
+                'WHERE path = ?', ((count, path) for (path, count) in whitelist.items()))
+            conn.executemany(
+                'INSERT INTO hits (trace_id, path_id, count) '
+                'SELECT ?, id, ? FROM paths WHERE path = ?',
+                ((trace_id, count, path) for (path, count) in whitelist.items()))
+        if old_ids:
+            print('Replaced changed trace %s in the index' % csv_path)
+        else:
+            print('Added trace %s to the index' % csv_path)
+    finally:
+        conn.close()
+
+
+def query_trace_index(db_path, min_traces=1):
+    """Count accesses to paths touched by at least min_traces traces"""
+    conn = open_trace_index(db_path)
+    try:
+        (trace_count,) = conn.execute('SELECT COUNT(*) FROM traces').fetchone()
+        whitelist = Counter(dict(conn.execute(
+            'SELECT path, accesses FROM paths WHERE traces >= ?', (min_traces,))))
+    finally:
+        conn.close()
+    print('%d paths were touched by at least %d of %d traces in the index' %
+          (len(whitelist), min_traces, trace_count))
+    return whitelist
+
+
+def benchmark_normalizer(count=200000, unique=5000):
+    """Compare clean_filename() to PathNormalizer on synthetic paths"""
+    import random
+    import timeit
+    base_path = 'C:\\Users\\username\\Desktop\\BleachBit-portable\\'
+    rng = random.Random(0)
+    dirs = ['', 'lib\\', 'share\\locale\\de\\LC_MESSAGES\\',
+            'share\\icons\\Adwaita\\16x16\\', 'lib\\gdk-pixbuf-2.0\\loaders\\']
+    names = ['%sFile%04d.dll' % (rng.choice(dirs), i) for i in range(unique)]
+    # Traces repeat the same paths many times.
+    corpus = [base_path + rng.choice(names) for _ in range(count)]
+
+    def run_clean_filename():
+        for fn in corpus:
+            clean_filename(fn, base_path)
+
+    def run_normalizer():
+        normalize = PathNormalizer(base_path)
+        for fn in corpus:
+            normalize(fn)
+
+    assert [clean_filename(fn, base_path) for fn in corpus[:1000]] == \
+        [PathNormalizer(base_path)(fn) for fn in corpus[:1000]]
+    t_old = min(timeit.repeat(run_clean_filename, number=1, repeat=3))
+    t_new = min(timeit.repeat(run_normalizer, number=1, repeat=3))
+    print('%d paths (%d unique)' % (count, unique))
+    print('clean_filename(): %.3f seconds' % t_old)
+    print('PathNormalizer:   %.3f seconds (%.1fx)' % (t_new, t_old / t_new))
+
 
 def go():
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument('csv_path')
-    parser.add_argument('base_path')
-    parser.add_argument('compare_path')
+    parser.add_argument('csv_path', nargs='?')
+    parser.add_argument('base_path', nargs='?')
+    parser.add_argument('compare_path', nargs='?')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of processes to analyze the trace')
+    parser.add_argument('--db',
+                        help='add the trace to this index of traces, and use '
+                        'every trace in the index for the whitelist')
+    parser.add_argument('--min-traces', type=int, default=1,
+                        help='with --db, keep paths touched by at least this many traces')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the parsed trace in TRACE.cache for later runs')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='time path normalization on synthetic paths and exit')
     args = parser.parse_args()
 
-    whitelist = get_whitelist(args.csv_path, args.base_path)
+    if args.benchmark:
+        benchmark_normalizer()
+        return
+    if not (args.csv_path and args.base_path and args.compare_path):
+        parser.error('csv_path, base_path, and compare_path are required')
+
+    if args.db:
+        update_trace_index(args.db, args.csv_path, args.base_path, args.jobs, args.cache)
+        whitelist = query_trace_index(args.db, args.min_traces)
+    else:
+        whitelist = get_whitelist(args.csv_path, args.base_path, args.jobs,
+                                  use_cache=args.cache)
     list_to_file(whitelist, 'whitelist.txt')
 
-    (keep, remove) = walk_compare_path(args.compare_path, whitelist)
+    (keep, remove, remove_dirs, folders) = walk_compare_path(
+        args.compare_path, PathTrie.from_counts(whitelist))
     list_to_file(keep, 'keep.txt')
     list_to_file(remove, 'remove.txt')
+    list_to_file(remove_dirs, 'remove_dirs.txt')
+    folders_to_file(folders, 'coverage.txt')
+    keep_bytes = sum(keep.values())
+    remove_bytes = sum(remove.values())
+    print('Keep %d files (%d bytes), remove %d files (%d bytes), saving %.1f%%' %
+          (len(keep), keep_bytes, len(remove), remove_bytes,
+           100. * remove_bytes / max(keep_bytes + remove_bytes, 1)))
+
+
+class TestAnalyzeTrace(unittest.TestCase):
+    """Test the analysis of a small Process Monitor trace"""
+
+    base_path = 'C:\\Users\\me\\Desktop\\BleachBit-portable\\'
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix='bleachbit-test-')
+        self.csv_path = os.path.join(self.test_dir, 'trace.csv')
+        paths = [
+            (self.base_path + 'bleachbit.exe', 'SUCCESS'),
+            (self.base_path + 'lib\\python3.dll', 'SUCCESS'),
+            (self.base_path + 'LIB\\Mixed.DLL', 'SUCCESS'),
+            (self.base_path + 'share\\locale\\de\\*', 'SUCCESS'),
+            (self.base_path + 'share\\locale\\de\\bleachbit.mo', 'SUCCESS'),
+            (self.base_path + 'share\\missing.txt', 'NAME NOT FOUND'),
+            (self.base_path + 'share\\icons\\', 'SUCCESS'),
+            ('C:\\Windows\\System32\\kernel32.dll', 'SUCCESS'),
+            ('HKLM\\Software\\BleachBit', 'SUCCESS'),
+        ]
+        with open(self.csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(['Time of Day', 'Process Name', 'PID', 'Operation',
+                             'Path', 'Result', 'Detail'])
+            self.success_rows = 0
+            for i in range(500):
+                (path, result) = paths[(i * 7) % len(paths)]
+                if result == 'SUCCESS' and not is_filtered(path):
+                    self.success_rows += 1
+                writer.writerow(['1:00', 'bleachbit.exe', '12', 'CreateFile', path, result,
+                                 'Desired Access: Read, Write'])
+        self.compare_path = os.path.join(self.test_dir, 'dist') + os.sep
+        for fn in ('bleachbit.exe', 'unused.exe', 'lib/python3.dll', 'lib/mixed.dll',
+                   'lib/unused.dll', 'share/locale/de/bleachbit.mo',
+                   'share/locale/fr/bleachbit.mo', 'share/icons/a/b.png'):
+            full_path = os.path.join(self.compare_path, fn)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'wb') as f:
+                f.write(b'x' * len(fn))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def baseline_whitelist(self):
+        """Return the set of cleaned paths as the original single-pass reader did"""
+        whitelist = set()
+        with open(self.csv_path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if 'SUCCESS' == row[5] and not is_filtered(row[4]):
+                    whitelist.add(clean_filename(row[4], self.base_path))
+        return whitelist
+
+    def test_get_whitelist(self):
+        """Sharded and cached runs give the same whitelist as a single process"""
+        self.assertGreater(len(split_trace(self.csv_path, 4)), 1)
+        (whitelist, rows) = get_whitelist(self.csv_path, self.base_path, return_rows=True)
+        self.assertEqual(rows, 501)
+        self.assertEqual(set(whitelist), self.baseline_whitelist())
+        self.assertEqual(sum(whitelist.values()), self.success_rows)
+        for (jobs, use_cache) in ((4, False), (1, True), (1, True), (4, True)):
+            with self.subTest(jobs=jobs, use_cache=use_cache):
+                self.assertEqual(get_whitelist(self.csv_path, self.base_path, jobs,
+                                               use_cache=use_cache), whitelist)
+        self.assertTrue(os.path.exists(self.csv_path + '.cache'))
+
+    def test_damaged_cache(self):
+        """A truncated or otherwise damaged cache is rebuilt"""
+        cache_path = self.csv_path + '.cache'
+        whitelist = get_whitelist(self.csv_path, self.base_path, use_cache=True)
+        with open(cache_path, 'rb') as f:
+            good = f.read()
+        damaged = {'truncated columns': good[:-64],
+                   'truncated header': good[:24],
+                   'empty': b'',
+                   'bad length': TRACE_CACHE_MAGIC + b'\xff' * 8,
+                   'not a cache': b'garbage' * 10}
+        for (name, data) in damaged.items():
+            with self.subTest(damage=name):
+                with open(cache_path, 'wb') as f:
+                    f.write(data)
+                self.assertEqual(
+                    get_whitelist(self.csv_path, self.base_path, use_cache=True), whitelist)
+                with open(cache_path, 'rb') as f:
+                    self.assertEqual(f.read(), good)
+
+    def test_trace_index(self):
+        """A changed trace replaces its old entry in the index"""
+        db_path = os.path.join(self.test_dir, 'index.sqlite')
+        whitelist = get_whitelist(self.csv_path, self.base_path)
+        update_trace_index(db_path, self.csv_path, self.base_path)
+        self.assertEqual(query_trace_index(db_path), whitelist)
+        # touched: parsed again, but still one trace
+        st = os.stat(self.csv_path)
+        os.utime(self.csv_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        update_trace_index(db_path, self.csv_path, self.base_path)
+        self.assertEqual(query_trace_index(db_path), whitelist)
+        self.assertEqual(query_trace_index(db_path, min_traces=2), {})
+        # re-exported with fewer rows: the old counts are gone
+        with open(self.csv_path, encoding='utf-8') as f:
+            lines = f.readlines()
+        with open(self.csv_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines[:50])
+        update_trace_index(db_path, self.csv_path, self.base_path)
+        smaller = get_whitelist(self.csv_path, self.base_path)
+        self.assertEqual(query_trace_index(db_path), smaller)
+        # a second trace counts toward min_traces
+        other_csv = os.path.join(self.test_dir, 'other.csv')
+        shutil.copy(self.csv_path, other_csv)
+        update_trace_index(db_path, other_csv, self.base_path)
+        both = query_trace_index(db_path, min_traces=2)
+        self.assertEqual(both, smaller + smaller)
+        conn = open_trace_index(db_path)
+        try:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM traces').fetchone(), (2,))
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM hits').fetchone(),
+                             (2 * len(smaller),))
+        finally:
+            conn.close()
+
+    def test_walk_compare_path(self):
+        """keep and remove match the original os.walk() and clean_filename() comparison"""
+        whitelist = get_whitelist(self.csv_path, self.base_path, 4)
+        baseline = set(self.baseline_whitelist())
+        for compare_path in (self.compare_path, self.compare_path.rstrip(os.sep)):
+            with self.subTest(compare_path=compare_path):
+                (keep, remove, remove_dirs, _folders) = walk_compare_path(
+                    compare_path, PathTrie.from_counts(whitelist))
+                expected_keep = set()
+                expected_remove = set()
+                for (root, _dirs, files) in os.walk(compare_path):
+                    for name in files:
+                        cleaned_path = clean_filename(os.path.join(root, name), compare_path)
+                        if cleaned_path in baseline:
+                            expected_keep.add(cleaned_path)
+                        else:
+                            expected_remove.add(cleaned_path)
+                self.assertEqual(set(keep), expected_keep)
+                self.assertEqual(set(remove), expected_remove)
+                if compare_path.endswith(os.sep):
+                    self.assertEqual(len(keep), 4)
+                    self.assertEqual(remove_dirs,
+                                     {'share\\locale\\fr\\', 'share\\icons\\'})
 
 
-go()
+if __name__ == '__main__':
+    go()
@@ -12,15 +12,24 @@
 Transform Git log into translation credits
 """
 
+import hashlib
+import json
 import os
+import re
+import sqlite3
 import subprocess
 import sys
 
 
+LOG_PATTERN = re.compile(r'^\w{8} Update (.*) translation thanks to (\.*)')
+# Cached results are only used with the same parsing rules. Increase this
+# when process_line() changes in a way that LOG_PATTERN does not show.
+PARSER_VERSION = 1
+
+
 def process_line(line):
     """Process a single entry of the Git log"""
-    import re
-    groups = re.split(r'^\w{8} Update (.*) translation thanks to (\.*)', line)
+    groups = LOG_PATTERN.split(line)
     if len(groups) > 2:
         lang = groups[1]
         authors = groups[3].split(',')  # turn string into list
@@ -30,6 +39,86 @@ def process_line(line):
         return None
 
 
+def iter_log_lines(revision_range):
+    """Yield (commit SHA, one-line log entry) for a revision range as git writes them"""
+    # %h %s is the same as --oneline.
+    cmd = ['git', 'log', '--format=%H %h %s', revision_range, './po']
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, encoding='utf8') as proc:
+        for line in proc.stdout:
+            (sha, _sep, oneline) = line.rstrip('\n').partition(' ')
+            yield (sha, oneline)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+class CreditCache:
+    """Parsed log entries by commit SHA, stored in SQLite
+
+    The result of process_line() is stored for every commit, including
+    unrecognized ones. Entries parsed with other rules are discarded.
+    SQLite locking makes the cache safe to share between concurrent runs.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            cache_base = os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+            os.makedirs(cache_base, exist_ok=True)
+            path = os.path.join(cache_base, 'bleachbit-credit-translations.sqlite')
+        self.rules = hashlib.sha256(
+            f'{PARSER_VERSION} {LOG_PATTERN.pattern}'.encode()).hexdigest()
+        self.conn = sqlite3.connect(path, timeout=60)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS commits '
+                              '(sha TEXT PRIMARY KEY, rules TEXT NOT NULL, result TEXT)')
+            self.conn.execute('DELETE FROM commits WHERE rules != ?', (self.rules,))
+        self.results = {sha: json.loads(result) for (sha, result) in
+                        self.conn.execute('SELECT sha, result FROM commits')}
+        self.new_results = {}
+
+    def process_line(self, sha, line):
+        """Return process_line(line), using the cached result for the commit"""
+        if sha in self.results:
+            result = self.results[sha]
+            return tuple(result) if result else None
+        ret = process_line(line)
+        self.results[sha] = self.new_results[sha] = ret
+        return ret
+
+    def close(self):
+        """Store the new results"""
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO commits (sha, rules, result) VALUES (?, ?, ?)',
+                ((sha, self.rules, json.dumps(ret)) for (sha, ret) in self.new_results.items()))
+        self.conn.close()
+
+
+def collect_credit(log_entries, credit=None, unrecognized_lines=None, cache=None):
+    """Add the translation credit in Git log entries to the dictionary
+
+    log_entries yields (commit SHA, one-line log entry). credit maps
+    each language to a set of authors. Lines that are not translation
+    updates are added to the unrecognized_lines set. With a CreditCache,
+    commits parsed by an earlier run are not parsed again.
+    """
+    if credit is None:
+        credit = {}
+    if unrecognized_lines is None:
+        unrecognized_lines = set()
+    for (sha, line) in log_entries:
+        if cache:
+            ret = cache.process_line(sha, line)
+        else:
+            ret = process_line(line)
+        if ret:
+            # Found a translation update
+            (lang, authors) = ret
+            credit.setdefault(lang, set()).update(authors)
+        else:
+            unrecognized_lines.add(line)
+    return (credit, unrecognized_lines)
+
+
 def make_html_snippet(credit):
     """Make an HTML snippet to show credit
 
@@ -47,34 +136,26 @@ def make_html_snippet(credit):
 def usage():
     print('usage:')
     print('argument 1: path to BleachBit repository')
-    print('argument 2: Git revision range such as v2.2...v2.3')
+    print('argument 2 and later: Git revision ranges such as v2.2...v2.3')
     sys.exit(1)
 
 
 def go():
     """Main"""
-    if not len(sys.argv) == 3:
+    if len(sys.argv) < 3:
         usage()
     root_dir = sys.argv[1]
-    revision_range = sys.argv[2]
+    revision_ranges = sys.argv[2:]
     os.chdir(root_dir)
-    cmd = ['git', 'log', '--oneline', revision_range, './po']
-    cp = subprocess.run(cmd, capture_output=True, encoding='utf8')
-    lines = cp.stdout.split('\n')
     credit = {}
-    unrecognized_lines = []
-    for line in lines:
-        ret = process_line(line)
-        if ret:
-            # Found a translation update
-            lang = ret[0]
-            authors = ret[1]
-            if lang in credit:
-                credit[lang] = credit[lang] + authors
-            else:
-                credit[lang] = authors
-        else:
-            unrecognized_lines.append(line)
+    unrecognized_lines = set()
+    cache = CreditCache()
+    try:
+        for revision_range in revision_ranges:
+            # Commits in overlapping ranges are credited once.
+            collect_credit(iter_log_lines(revision_range), credit, unrecognized_lines, cache)
+    finally:
+        cache.close()
     make_html_snippet(credit)
     for line in sorted(unrecognized_lines):
         print('<li>%s</li>' % line)
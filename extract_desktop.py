@@ -15,46 +15,136 @@ Here is how it works
 2. Weblate syncs translation strings from GitHub to hosted.weblate.org
 3. Weblate asks users to translate the strings
 4. Weblate pushes the .po files to the GitHub repository
-5. This program extracts the two strings
+5. This program extracts the two strings, from the compiled catalogs or,
+   with --from-po or when they are not compiled, directly from the .po files
 6. I copy the output of this program and paste it into bleachbit.desktop
 """
 
 
+import concurrent.futures
 import gettext
 import os
+import re
+import shutil
 import sys
-import subprocess
+import tempfile
+import unittest
 
 bleachbit_repo_dir = '../bleachbit'
-if not os.path.exists(bleachbit_repo_dir):
-    print('The bleachbit repository does not exist in ', bleachbit_repo_dir)
-    sys.exit(1)
-os.chdir(bleachbit_repo_dir)
-sys.path.append(".")
+locale_dir = 'locale'
 
-import setup
 
+# keys in the desktop file and their English values
+DESKTOP_KEYS = (
+    ('Comment', 'Free space and maintain privacy'),
+    ('GenericName', 'Unnecessary file cleaner'),
+)
+
+
+def load_catalogs(langids, workers=8):
+    """Open and parse each language's .mo catalog once
+
+    Catalogs are independent, so they load on a thread pool.
+    Returns a dictionary of language ID to translation object.
+    """
+    def load(langid):
+        return gettext.translation('bleachbit', localedir=locale_dir, languages=[langid])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(langids, executor.map(load, langids)))
+
+
+def translate_all(catalogs, msgids):
+    """Look up all msgids in all catalogs in one pass
+
+    Returns a dictionary of language ID to a dictionary of msgid to
+    translated string.
+    """
+    return {langid: {msgid: catalog.gettext(msgid) for msgid in msgids}
+            for (langid, catalog) in catalogs.items()}
+
+
+PO_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\'}
+PO_ESCAPE_PATTERN = re.compile(r'\\(.)')
 
-locale_dir = 'locale'
 
-gettext.bindtextdomain('bleachbit', locale_dir)
-gettext.textdomain('bleachbit')
-gettext.install('bleachbit', locale_dir)
+def unquote_po(text):
+    """Return the value of a quoted .po string such as "a\\"b\""""
+    text = text.strip()
+    if not (len(text) >= 2 and text[0] == '"' and text[-1] == '"'):
+        raise ValueError(f'not a quoted string: {text}')
+    return PO_ESCAPE_PATTERN.sub(lambda m: PO_ESCAPES.get(m.group(1), m.group(0)), text[1:-1])
 
 
-def get_lang_str(langid, str):
-    lang = gettext.translation(
-        'bleachbit', localedir=locale_dir, languages=[langid])
-    lang.install()
-    return lang.gettext(str)
+def read_po_strings(po_path, msgids):
+    """Read the translations of msgids directly from a .po file
 
+    The file is read line by line, and reading stops once every msgid
+    has been found. As in a compiled catalog, fuzzy, obsolete, and empty
+    translations are ignored, and a msgid without a translation maps to
+    itself.
+    """
+    wanted = set(msgids)
+    found = {}
+    entry = {}
+    field = None
 
-def update_desktop(parser, key, value):
+    def finish_entry():
+        msgid = entry.get('msgid')
+        if msgid in wanted and msgid not in found and entry.get('msgstr') \
+                and 'msgctxt' not in entry and 'plural' not in entry \
+                and not entry.get('fuzzy'):
+            found[msgid] = entry['msgstr']
+        entry.clear()
+
+    with open(po_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('"'):
+                if field:
+                    entry[field] += unquote_po(line)
+                continue
+            (keyword, _sep, value) = line.partition(' ')
+            # A comment, blank line, msgctxt or msgid after a msgstr or
+            # msgstr[N] starts the next entry.
+            if entry.get('done') and (not line or line.startswith('#')
+                                      or keyword in ('msgctxt', 'msgid')):
+                finish_entry()
+                field = None
+                if len(found) == len(wanted):
+                    break
+            if not line or line.startswith('#'):
+                if line.startswith('#,') and 'fuzzy' in line:
+                    entry['fuzzy'] = True
+                continue
+            if keyword in ('msgctxt', 'msgid', 'msgstr'):
+                field = keyword
+                entry[field] = unquote_po(value)
+            else:
+                # msgid_plural and msgstr[N] are not needed here
+                field = None
+                entry['plural'] = True
+            if keyword.startswith('msgstr'):
+                entry['done'] = True
+        else:
+            finish_entry()
+    return {msgid: found.get(msgid, msgid) for msgid in msgids}
+
+
+def translate_all_from_po(langids, msgids, workers=8):
+    """Look up msgids directly in the .po files, without compiling them
+
+    Returns the same structure as translate_all().
+    """
+    def read(langid):
+        return read_po_strings(os.path.join('po', langid + '.po'), msgids)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(langids, executor.map(read, langids)))
+
+
+def update_desktop(parser, key, value, translations):
     changes = 0
-    for langid in sorted(setup.supported_languages()):
-        if '_new' in langid:
-            raise ValueError('langid=_new')
-        translated = get_lang_str(langid, value)
+    for langid in sorted(translations):
+        translated = translations[langid][value]
         key_lang = f"{key}[{langid}]"
 
         if translated == value:
@@ -75,37 +165,114 @@ def update_desktop(parser, key, value):
         parser['Desktop Entry'][key_lang] = translated
     return changes
 
-def process_desktop_file():
+def process_desktop_file(from_po=False):
     from configparser import ConfigParser
+    import setup
     parser = ConfigParser()
     parser.optionxform = str # preserve case
     parser.read('org.bleachbit.BleachBit.desktop', encoding='utf-8')
-    changes = update_desktop(
-        parser, 'Comment', 'Free space and maintain privacy')
-    changes += update_desktop(
-        parser, 'GenericName', 'Unnecessary file cleaner')
+    langids = sorted(setup.supported_languages())
+    for langid in langids:
+        if '_new' in langid:
+            raise ValueError('langid=_new')
+    msgids = [value for (_key, value) in DESKTOP_KEYS]
+    if from_po:
+        translations = translate_all_from_po(langids, msgids)
+    else:
+        translations = translate_all(load_catalogs(langids), msgids)
+    changes = 0
+    for (key, value) in DESKTOP_KEYS:
+        changes += update_desktop(parser, key, value, translations)
     print(f"Made {changes} change(s) to org.bleachbit.BleachBit.desktop")
     with open('org.bleachbit.BleachBit.desktop', 'w', encoding='utf-8') as f:
         parser.write(f, space_around_delimiters=False)
 
 def main():
+    if not os.path.exists(bleachbit_repo_dir):
+        print('The bleachbit repository does not exist in ', bleachbit_repo_dir)
+        sys.exit(1)
+    os.chdir(bleachbit_repo_dir)
+    sys.path.append(".")
+    gettext.bindtextdomain('bleachbit', locale_dir)
+    gettext.textdomain('bleachbit')
+    gettext.install('bleachbit', locale_dir)
     if not os.path.exists('po/es.po'):
         print('ERROR: po/es.po does not exist.')
         print('Tip: Verify you are in the root directory of the BleachBit repository.')
         sys.exit(1)
-    if not os.path.exists('po/es.mo'):
-        print('ERROR: po/es.mo does not exist, so it seems translations are not compiled.')
-        print('Tip: try running "make -C po local" from the BleachBit repo.')
-        print('Running the command for you.')
-        ret = subprocess.run(['make', '-C', 'po', 'local'])
-        if ret.returncode != 0:
-            print('ERROR: running "make -C po local" failed')
-            sys.exit(1)
-        if not os.path.exists('po/es.mo'):
-            print('ERROR: po/es.mo does not exist even after running "make -C po local"')
-            sys.exit(1)
-    process_desktop_file()
-
-
-
-main()
+    from_po = '--from-po' in sys.argv[1:]
+    if not from_po and not os.path.exists('po/es.mo'):
+        print('po/es.mo does not exist, so it seems translations are not compiled.')
+        print('Reading the translations directly from the .po files.')
+        from_po = True
+    process_desktop_file(from_po)
+
+
+class TestReadPoStrings(unittest.TestCase):
+    """Test reading translations directly from .po files"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix='bleachbit-test-')
+        self.po_path = os.path.join(self.test_dir, 'de.po')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def read(self, content):
+        with open(self.po_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return read_po_strings(self.po_path, [value for (_key, value) in DESKTOP_KEYS])
+
+    def test_plural_entries(self):
+        """Fuzzy and msgctxt plural entries do not leak into the next entry"""
+        translations = self.read('''msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+
+#, fuzzy
+msgid "file"
+msgid_plural "files"
+msgstr[0] "Datei"
+msgstr[1] "Dateien"
+msgid "Free space and maintain privacy"
+msgstr "Speicherplatz freigeben und Privatsphäre schützen"
+
+msgctxt "size"
+msgid "byte"
+msgid_plural "bytes"
+msgstr[0] "Byte"
+msgstr[1] "Bytes"
+msgid "Unnecessary file cleaner"
+msgstr ""
+"Bereinigung "
+"unnötiger Dateien"
+''')
+        self.assertEqual(translations, {
+            'Free space and maintain privacy': 'Speicherplatz freigeben und Privatsphäre schützen',
+            'Unnecessary file cleaner': 'Bereinigung unnötiger Dateien',
+        })
+
+    def test_ignored_entries(self):
+        """Fuzzy, msgctxt, obsolete and empty translations are ignored"""
+        translations = self.read('''#, fuzzy
+msgid "Free space and maintain privacy"
+msgstr "unscharf"
+
+msgctxt "menu"
+msgid "Unnecessary file cleaner"
+msgstr "mit Kontext"
+
+#~ msgid "Unnecessary file cleaner"
+#~ msgstr "veraltet"
+
+msgid "Unnecessary file cleaner"
+msgstr ""
+''')
+        self.assertEqual(translations, {
+            'Free space and maintain privacy': 'Free space and maintain privacy',
+            'Unnecessary file cleaner': 'Unnecessary file cleaner',
+        })
+
+
+if __name__ == '__main__':
+    main()
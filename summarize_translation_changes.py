@@ -10,6 +10,9 @@
 """Summarize translation changes over a git commit range."""
 
 import argparse
+import concurrent.futures
+import itertools
+import operator
 import os
 import re
 import shutil
@@ -17,13 +20,14 @@ import subprocess
 import sys
 import tempfile
 import unittest
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 
 WEBLATE_URL_TEMPLATE = 'https://hosted.weblate.org/projects/bleachbit/main/%s/'
 MSGSTR_PATTERN = re.compile(r'\+msgstr\s+"(.*)"\s*$')
 MULTILINE_MSGSTR_PATTERN = re.compile(r'\+"(.+)"')
-MAX_LOOKAHEAD_LINES = 20
+# Keep the diff parseable regardless of the user's git configuration
+DIFF_OPTIONS = ('--src-prefix=a/', '--dst-prefix=b/', '--no-color', '--no-ext-diff')
 
 
 class BleachbitLanguageManager:
@@ -152,7 +156,7 @@ def count_msgstr_changes(repo_path: str, commit_range: str, po_file: str) -> int
     """
     try:
         result = subprocess.run(
-            ['git', 'diff', commit_range, '--', po_file],
+            ['git', 'diff', *DIFF_OPTIONS, commit_range, '--', po_file],
             cwd=repo_path,
             capture_output=True,
             text=True,
@@ -166,28 +170,146 @@ def count_msgstr_changes(repo_path: str, commit_range: str, po_file: str) -> int
     return _parse_msgstr_changes(diff_output)
 
 
-def _parse_msgstr_changes(diff_output: str) -> int:
-    """Parse git diff output to count msgstr changes.
+def get_new_po_files_in_range(repo_path: str, commit_range: str) -> List[str]:
+    """Get list of .po files that were added in the commit range.
+
+    This answers is_new_language() for every file with one git command.
 
     Args:
-        diff_output: Git diff output text
+        repo_path: Path to the git repository
+        commit_range: Git commit range (e.g., 'v5.0.0...v5.0.2')
 
     Returns:
-        Number of non-empty msgstr changes
+        List of added .po file paths
+
+    Raises:
+        SystemExit: If git command fails
     """
-    lines = diff_output.split('\n')
-    count = 0
-    i = 0
+    try:
+        result = subprocess.run(
+            ['git', 'diff', '--diff-filter=A', '--name-only', commit_range, '--', 'po/*.po'],
+            cwd=repo_path,
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        return [f for f in result.stdout.strip().split('\n') if f]
+    except subprocess.CalledProcessError as e:
+        sys.stderr.write(f"Error getting added files: {e}\n")
+        sys.exit(1)
+
+
+def _split_diff_by_file(lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """Label each line of combined git diff output with its file.
+
+    Lines are not buffered, so itertools.groupby() can pass the diff of
+    each file to a parser as it streams in.
+
+    Args:
+        lines: Lines of git diff output, with or without line endings
+
+    Yields:
+        Tuples of (file path, diff line without line ending)
+    """
+    po_file = None
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.startswith('diff --git '):
+            # diff --git a/po/de.po b/po/de.po
+            po_file = line.rpartition(' b/')[2]
+        if po_file is not None:
+            yield po_file, line
+
+
+def count_msgstr_changes_in_range(repo_path: str, commit_range: str) -> Dict[str, int]:
+    """Count non-empty msgstr changes in every .po file with one git diff.
+
+    Args:
+        repo_path: Path to the git repository
+        commit_range: Git commit range
+
+    Returns:
+        Dictionary mapping each modified .po file path to its number of
+        non-empty msgstr changes, in git order
+
+    Raises:
+        SystemExit: If git command fails
+    """
+    cmd = ['git', 'diff', *DIFF_OPTIONS, commit_range, '--', 'po/*.po']
+    changes: Dict[str, int] = {}
+    with subprocess.Popen(cmd, cwd=repo_path, stdout=subprocess.PIPE,
+                          encoding='utf-8', errors='replace') as proc:
+        for po_file, file_lines in itertools.groupby(_split_diff_by_file(proc.stdout),
+                                                     key=operator.itemgetter(0)):
+            changes[po_file] = _parse_msgstr_changes(line for _, line in file_lines)
+    if proc.returncode:
+        sys.stderr.write(f"Error getting diff: {subprocess.CalledProcessError(proc.returncode, cmd)}\n")
+        sys.exit(1)
+    return changes
+
+
+def summarize_po_files(repo_path: str, commit_range: str, po_files: List[str],
+                       jobs: int) -> Tuple[Dict[str, int], List[str]]:
+    """Count msgstr changes and detect new languages file by file.
+
+    The files are processed concurrently, and the results keep the order
+    of po_files, so the summary matches a serial run.
+
+    Args:
+        repo_path: Path to the git repository
+        commit_range: Git commit range
+        po_files: Paths of the modified .po files
+        jobs: Maximum number of files processed at once
+
+    Returns:
+        Tuple of (dictionary mapping each .po file path to its number of
+        non-empty msgstr changes, list of new .po file paths)
+    """
+    def summarize(po_file: str) -> Tuple[bool, int]:
+        return (is_new_language(repo_path, commit_range, po_file),
+                count_msgstr_changes(repo_path, commit_range, po_file))
 
-    while i < len(lines):
-        line = lines[i]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = list(executor.map(summarize, po_files))
+    changes_by_file = {po_file: changes for po_file, (_, changes) in zip(po_files, results)}
+    new_po_files = [po_file for po_file, (is_new, _) in zip(po_files, results) if is_new]
+    return changes_by_file, new_po_files
 
-        if line.startswith('+msgstr "') and not line.startswith('+++'):
-            count += _handle_single_line_msgstr(line)
-        elif line == '+msgstr ""':
-            count += _handle_multiline_msgstr(lines, i)
 
-        i += 1
+def _parse_msgstr_changes(diff_output: Union[str, Iterable[str]]) -> int:
+    """Parse git diff output to count msgstr changes.
+
+    The lines are read once with constant memory, so the diff may come
+    from a pipe. An added msgstr counts when its first line or any
+    number of added continuation lines has content.
+
+    Args:
+        diff_output: Git diff output text, or an iterable of its lines
+
+    Returns:
+        Number of non-empty msgstr changes
+    """
+    if isinstance(diff_output, str):
+        diff_output = diff_output.split('\n')
+    count = 0
+    in_empty_msgstr = False
+
+    for line in diff_output:
+        line = line.rstrip('\n')
+        if in_empty_msgstr:
+            if line.startswith('+"'):
+                if _handle_continuation_line(line):
+                    count += 1
+                    in_empty_msgstr = False
+                continue
+            in_empty_msgstr = False
+
+        if line.startswith('+msgstr "'):
+            if _handle_single_line_msgstr(line):
+                count += 1
+            else:
+                # msgstr "" may continue on the following lines
+                in_empty_msgstr = True
 
     return count
 
@@ -207,28 +329,18 @@ def _handle_single_line_msgstr(line: str) -> int:
     return 0
 
 
-def _handle_multiline_msgstr(lines: List[str], start_idx: int) -> int:
-    """Handle multi-line msgstr changes.
+def _handle_continuation_line(line: str) -> int:
+    """Handle a continuation line of a multi-line msgstr.
 
     Args:
-        lines: All diff lines
-        start_idx: Starting index of the multiline msgstr
+        line: The diff line containing a quoted string
 
     Returns:
-        1 if multiline msgstr has content, 0 otherwise
+        1 if the line has content, 0 otherwise
     """
-    # Look ahead for continuation lines
-    end_idx = min(start_idx + MAX_LOOKAHEAD_LINES, len(lines))
-
-    for j in range(start_idx + 1, end_idx):
-        if not lines[j].startswith('+'):
-            break
-
-        if lines[j] != '+""':
-            content_match = MULTILINE_MSGSTR_PATTERN.match(lines[j])
-            if content_match and content_match.group(1):
-                return 1
-
+    match = MULTILINE_MSGSTR_PATTERN.match(line)
+    if match and match.group(1):
+        return 1
     return 0
 
 def display_summary(language_changes: Dict[str, int], new_languages: List[str], lang_manager: BleachbitLanguageManager) -> None:
@@ -322,6 +434,53 @@ def _format_new_languages(new_languages: List[str], lang_manager: BleachbitLangu
     return f"New language{lang_plural} added: {', '.join(lang_names)}\n"
 
 
+def benchmark_parser(size_mb: int = 300) -> None:
+    """Time the streaming diff parser on a synthetic multi-file diff.
+
+    The diff is written to a temporary file and read back as a stream,
+    as from a git pipe, so peak memory shows whether parsing is constant.
+
+    Args:
+        size_mb: Approximate size of the synthetic diff in megabytes
+    """
+    import resource
+    import time
+    entries = [
+        ('+msgstr "übersetzt"\n', 1),
+        ('-msgstr "alt"\n', 0),
+        (' msgstr "unverändert"\n', 0),
+        ('+msgstr ""\n', 0),
+        ('+msgstr ""\n' + '+""\n' * 40 + '+"lang"\n', 1),
+        ('+msgstr ""\n+"zwei "\n+"Zeilen"\n', 1),
+    ]
+    expected = 0
+    size = 0
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as f:
+        i = 0
+        while size < size_mb * 1024 * 1024:
+            if i % 10000 == 0:
+                po_file = f'po/x{i // 10000}.po'
+                size += f.write(f'diff --git a/{po_file} b/{po_file}\n'
+                                f'--- a/{po_file}\n+++ b/{po_file}\n')
+            entry, count = entries[i % len(entries)]
+            size += f.write(f'+msgid "message {i}"\n{entry}')
+            expected += count
+            i += 1
+        f.seek(0)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        total = 0
+        for _po_file, file_lines in itertools.groupby(_split_diff_by_file(f),
+                                                      key=operator.itemgetter(0)):
+            total += _parse_msgstr_changes(line for _, line in file_lines)
+        elapsed = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert total == expected, (total, expected)
+    print(f'{size / 1e6:.1f} MB diff, {i} entries, {total} msgstr changes')
+    print(f'parse: {elapsed:.2f} seconds ({size / 1e6 / elapsed:.1f} MB/s)')
+    print(f'peak RSS growth: {(rss_after - rss_before) / 1024:.1f} MB')
+
+
 def main() -> None:
     """Main function."""
     parser = argparse.ArgumentParser(
@@ -329,16 +488,36 @@ def main() -> None:
     )
     parser.add_argument(
         'commit_range',
+        nargs='?',
         help='Git commit range (e.g., v5.0.0...v5.0.2)'
     )
     parser.add_argument(
         '--repo-path',
-        required=True,
         help='Path to bleachbit repository'
     )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        metavar='N',
+        help='Run git for each .po file, N files at a time, instead of one combined diff'
+    )
+    parser.add_argument(
+        '--benchmark',
+        nargs='?',
+        const=300,
+        type=int,
+        metavar='MB',
+        help='Time the diff parser on a synthetic diff of this size (default 300)'
+    )
 
     args = parser.parse_args()
 
+    if args.benchmark:
+        benchmark_parser(args.benchmark)
+        return
+    if not args.commit_range or not args.repo_path:
+        parser.error('commit_range and --repo-path are required')
+
     repo_path = os.path.abspath(os.path.expanduser(args.repo_path))
     if not os.path.isdir(repo_path):
         sys.stderr.write(f"Repository path does not exist: {repo_path}\n")
@@ -347,28 +526,36 @@ def main() -> None:
     # Initialize language manager
     lang_manager = BleachbitLanguageManager(repo_path)
 
-    # Get list of modified .po files
-    po_files = get_po_files_in_range(repo_path, args.commit_range)
+    if args.jobs:
+        # Count changes file by file on a thread pool
+        po_files = get_po_files_in_range(repo_path, args.commit_range)
+        changes_by_file, new_po_file_list = summarize_po_files(
+            repo_path, args.commit_range, po_files, args.jobs)
+    else:
+        # Count changes in all modified .po files with one diff
+        changes_by_file = count_msgstr_changes_in_range(repo_path, args.commit_range)
 
-    if not po_files:
+    if not changes_by_file:
         print("No translation files were modified in this range.")
         return
 
+    if not args.jobs:
+        new_po_file_list = get_new_po_files_in_range(repo_path, args.commit_range)
+    new_po_files = set(new_po_file_list)
+
     # Count changes per language and track new languages
     language_changes: Dict[str, int] = {}
     new_languages: List[str] = []
 
-    for po_file in po_files:
+    for po_file, changes in changes_by_file.items():
         locale = get_locale_from_filename(po_file)
         if not locale:
             continue
 
         # Check if new language (regardless of whether it has changes)
-        if is_new_language(repo_path, args.commit_range, po_file):
+        if po_file in new_po_files:
             new_languages.append(locale)
 
-        # Count changes
-        changes = count_msgstr_changes(repo_path, args.commit_range, po_file)
         if changes > 0:
             language_changes[locale] = changes
 
@@ -505,6 +692,112 @@ class TestSummarizeTranslationChanges(unittest.TestCase):
         )
         self.assertEqual(count, 2)
 
+    def test_count_msgstr_changes_in_range(self) -> None:
+        """Test counting msgstr changes in all files with one diff."""
+        commit_range = f'{self.commit1}...{self.commit2}'
+        changes = count_msgstr_changes_in_range(self.test_dir, commit_range)
+        self.assertEqual(changes, {'po/de.po': 20, 'po/el.po': 2})
+        for po_file, count in changes.items():
+            self.assertEqual(count, count_msgstr_changes(self.test_dir, commit_range, po_file))
+        self.assertEqual(
+            list(changes),
+            get_po_files_in_range(self.test_dir, commit_range)
+        )
+
+    def test_diff_config_ignored(self) -> None:
+        """Test that the user's diff configuration does not change the counts."""
+        commit_range = f'{self.commit1}...{self.commit2}'
+        for key, value in (('diff.noprefix', 'true'), ('color.diff', 'always'),
+                           ('diff.mnemonicPrefix', 'true')):
+            subprocess.run(['git', 'config', key, value], cwd=self.test_dir, check=True)
+        try:
+            self.assertEqual(count_msgstr_changes_in_range(self.test_dir, commit_range),
+                             {'po/de.po': 20, 'po/el.po': 2})
+            self.assertEqual(count_msgstr_changes(self.test_dir, commit_range, 'po/de.po'), 20)
+        finally:
+            for key in ('diff.noprefix', 'color.diff', 'diff.mnemonicPrefix'):
+                subprocess.run(['git', 'config', '--unset', key], cwd=self.test_dir, check=True)
+
+    def test_get_new_po_files_in_range(self) -> None:
+        """Test detecting new languages with one diff."""
+        self.assertEqual(get_new_po_files_in_range(self.test_dir, 'v5.0.0...v5.0.1'), [])
+        self.assertEqual(
+            get_new_po_files_in_range(self.test_dir, f'{self.commit2}...{self.commit3}'),
+            [self.new_po_file]
+        )
+
+    def test_summarize_po_files(self) -> None:
+        """Test that concurrent per-file results match the serial run and the pipeline."""
+        commit_range = f'{self.commit1}...{self.commit3}'
+        po_files = get_po_files_in_range(self.test_dir, commit_range)
+        serial = summarize_po_files(self.test_dir, commit_range, po_files, 1)
+        self.assertEqual(serial, ({'po/de.po': 20, 'po/el.po': 2, 'po/fr.po': 1}, ['po/fr.po']))
+        for jobs in (2, 8):
+            result = summarize_po_files(self.test_dir, commit_range, po_files, jobs)
+            self.assertEqual(result, serial)
+            self.assertEqual(list(result[0]), list(serial[0]))
+        self.assertEqual(count_msgstr_changes_in_range(self.test_dir, commit_range), serial[0])
+        self.assertEqual(get_new_po_files_in_range(self.test_dir, commit_range), serial[1])
+
+    def test_split_diff_by_file(self) -> None:
+        """Test labeling combined diff output by file."""
+        diff = (
+            'diff --git a/po/de.po b/po/de.po\n'
+            '+msgstr "neu"\n'
+            'diff --git a/po/el.po b/po/el.po\n'
+            '+msgstr ""\n'
+        )
+        self.assertEqual(
+            list(_split_diff_by_file(diff.splitlines(True))),
+            [('po/de.po', 'diff --git a/po/de.po b/po/de.po'),
+             ('po/de.po', '+msgstr "neu"'),
+             ('po/el.po', 'diff --git a/po/el.po b/po/el.po'),
+             ('po/el.po', '+msgstr ""')]
+        )
+        self.assertEqual(list(_split_diff_by_file([])), [])
+
+    def test_parse_msgstr_changes(self) -> None:
+        """Test parsing msgstr changes from text and from lines."""
+        diff = '\n'.join([
+            '+++ b/po/de.po',
+            '+msgstr "eins"',
+            '+msgstr ""',
+            '-msgstr "alt"',
+            ' msgstr ""',
+            '+"context only"',
+            '+msgstr ""',
+            '+""',
+            '+"zwei"',
+            '+msgstr ""',
+            '+msgid "next"',
+            '+"not a msgstr"',
+        ])
+        self.assertEqual(_parse_msgstr_changes(diff), 2)
+        self.assertEqual(_parse_msgstr_changes(iter(diff.splitlines(True))), 2)
+        self.assertEqual(_parse_msgstr_changes(''), 0)
+
+    def test_parse_long_multiline_msgstr(self) -> None:
+        """Test that content after many empty continuation lines is counted."""
+        lines = ['+msgstr ""'] + ['+""'] * 100 + ['+"spät"', '+msgstr "x"']
+        self.assertEqual(_parse_msgstr_changes(lines), 2)
+
+    def test_count_long_multiline_msgstr(self) -> None:
+        """Test counting a long multi-line msgstr committed to the fixture."""
+        po_file = 'po/lt.po'
+        with open(os.path.join(self.test_dir, po_file), 'w', encoding='utf-8') as f:
+            f.write('msgid "long"\nmsgstr ""\n' + '""\n' * 30 + '"ilgas"\n')
+        subprocess.run(['git', 'add', po_file], cwd=self.test_dir, check=True)
+        subprocess.run(['git', 'commit', '-m', 'Add Lithuanian'], cwd=self.test_dir,
+                       check=True, capture_output=True)
+        commit_range = 'HEAD~1...HEAD'
+        try:
+            self.assertEqual(count_msgstr_changes(self.test_dir, commit_range, po_file), 1)
+            self.assertEqual(count_msgstr_changes_in_range(self.test_dir, commit_range),
+                             {po_file: 1})
+        finally:
+            subprocess.run(['git', 'reset', '--hard', 'HEAD~1'], cwd=self.test_dir,
+                           check=True, capture_output=True)
+
     @classmethod
     def tearDownClass(cls) -> None:
         """Clean up the temporary directory."""
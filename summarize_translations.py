@@ -10,25 +10,27 @@
 
 
 import gettext
+import json
 import os
 import os.path
-import re
+import shutil
 import subprocess
 import sys
+import tempfile
+import unittest
 
 dir_bb_root = os.path.abspath('../bleachbit')
 dir_bb_locale = os.path.abspath('../bleachbit/locale')
 dir_bb_po = os.path.abspath('../bleachbit/po')
 
-os.chdir(dir_bb_root)
-sys.path.append(dir_bb_root)
 
-import setup
-import bleachbit.Language
-
-gettext.bindtextdomain('bleachbit', dir_bb_locale)
-gettext.textdomain('bleachbit')
-gettext.install('bleachbit', dir_bb_locale)
+def init_bleachbit():
+    """Change to the BleachBit repository and set up its translations"""
+    os.chdir(dir_bb_root)
+    sys.path.append(dir_bb_root)
+    gettext.bindtextdomain('bleachbit', dir_bb_locale)
+    gettext.textdomain('bleachbit')
+    gettext.install('bleachbit', dir_bb_locale)
 
 strs = [
     'Delete',
@@ -40,31 +42,250 @@ strs = [
 summary_str = 'Free space and maintain privacy'
 
 
-def get_translation_progress(lang):
+STATS_FORMAT_VERSION = 1
+
+
+def count_po_messages(lines):
+    """Count the translated, fuzzy and untranslated messages in a .po file
+
+    lines yields the lines of the file. The header and obsolete entries
+    are not counted, and a message with plural forms is translated only
+    when every form is non-empty. msgfmt --statistics checks only
+    msgstr[0], so a partly translated plural counts as untranslated here.
+
+    Returns a dictionary with the keys translated, fuzzy and untranslated.
+    """
+    counts = {'translated': 0, 'fuzzy': 0, 'untranslated': 0}
+    fuzzy = has_context = False
+    msgid = None  # whether the msgid is non-empty
+    msgstrs = []  # whether each msgstr form is non-empty
+    field = None
+
+    def finish():
+        if msgid is None or not msgstrs or not (msgid or has_context):
+            return
+        if not all(msgstrs):
+            counts['untranslated'] += 1
+        elif fuzzy:
+            counts['fuzzy'] += 1
+        else:
+            counts['translated'] += 1
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith('"'):
+            # continuation of the previous keyword
+            if len(line) > 2 and field == 'msgstr':
+                msgstrs[-1] = True
+            elif len(line) > 2 and field == 'msgid':
+                msgid = True
+            continue
+        (keyword, _sep, value) = line.partition(' ')
+        if msgstrs and keyword in ('', 'msgctxt', 'msgid') or keyword.startswith('#'):
+            # a new entry starts
+            if msgstrs:
+                finish()
+                fuzzy = has_context = False
+                msgid = None
+                msgstrs = []
+            field = None
+        if keyword == '#,' and 'fuzzy' in value:
+            fuzzy = True
+        elif keyword == 'msgctxt':
+            has_context = True
+            field = 'msgctxt'
+        elif keyword == 'msgid':
+            msgid = len(value.strip()) > 2
+            field = 'msgid'
+        elif keyword == 'msgid_plural':
+            field = 'msgid_plural'
+        elif keyword.startswith('msgstr'):
+            msgstrs.append(len(value.strip()) > 2)
+            field = 'msgstr'
+    finish()
+    return counts
+
+
+def format_progress(counts):
+    """Format message counts as a percentage translated
+
+    Fuzzy messages are left out, as in msgfmt --statistics.
+    """
+    translated = counts['translated']
+    untranslated = counts['untranslated']
+    if not untranslated:
+        return "100%"
+    # you should run 'make refresh-po' to update untranslated
+    return "%.0f%%" % (100. * translated / (untranslated + translated))
+
+
+class StatsCache:
+    """Message counts of .po files, keyed by path and modification time
+
+    The cache is stored as JSON, so an unchanged catalog is not parsed
+    again on later runs. Catalogs read from Git are keyed by blob SHA.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            cache_base = os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+            os.makedirs(cache_base, exist_ok=True)
+            path = os.path.join(cache_base, 'bleachbit-translation-stats.json')
+        self.path = path
+        self.entries = {}
+        self.blobs = {}
+        self.changed = False
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == STATS_FORMAT_VERSION:
+            self.entries = data['entries']
+            self.blobs = data.get('blobs', {})
+
+    def get_counts(self, po_path):
+        """Return count_po_messages() for the file, using the cached counts if unchanged"""
+        po_path = os.path.abspath(po_path)
+        st = os.stat(po_path)
+        key = [st.st_mtime_ns, st.st_size]
+        entry = self.entries.get(po_path)
+        if entry and entry['key'] == key:
+            return entry['counts']
+        with open(po_path, encoding='utf-8', errors='replace') as f:
+            counts = count_po_messages(f)
+        self.entries[po_path] = {'key': key, 'counts': counts}
+        self.changed = True
+        return counts
+
+    def put_blob_counts(self, sha, counts):
+        """Store the counts of a Git blob"""
+        self.blobs[sha] = counts
+        self.changed = True
+
+    def save(self):
+        """Write the cache if it changed"""
+        if not self.changed:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': STATS_FORMAT_VERSION, 'entries': self.entries,
+                       'blobs': self.blobs}, f)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
+def get_translation_progress(lang, cache=None):
     """Get the progress for a translation"""
     assert (isinstance(lang, str))
-    oldcwd = os.getcwd()
-    os.chdir(dir_bb_po)
-    args = ['msgfmt', '--statistics', '-o', lang + '.mo', lang + '.po']
-    outputs = subprocess.Popen(
-        args, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
-    output = outputs[1].decode()
-    os.chdir(oldcwd)
-    # 53 translated messages, 82 untranslated messages.
-    match = re.search('([0-9]+) translated messages.* ([0-9]+) untranslated message', output)
-    if match:
-        # you should run 'make refresh-po' to update untranslated
-        translated = int(match.group(1))
-        untranslated = int(match.group(2))
-        return "%.0f%%" % (100. * translated / (untranslated + translated))
-    match = re.search('([0-9]+) translated messages', output)
-    if match:
-        return "100%"
-    sys.stderr.write("Unknown output for language '%s': '%s'" % (lang, output))
-    return "?"
+    po_path = os.path.join(dir_bb_po, lang + '.po')
+    try:
+        if cache:
+            counts = cache.get_counts(po_path)
+        else:
+            with open(po_path, encoding='utf-8', errors='replace') as f:
+                counts = count_po_messages(f)
+    except OSError as e:
+        sys.stderr.write("Cannot read language '%s': %s\n" % (lang, e))
+        return "?"
+    return format_progress(counts)
+
+
+def get_all_translation_progress(langs):
+    """Get the progress for many translations
+
+    Returns a dictionary of language to progress.
+    """
+    cache = StatsCache()
+    progress = {lang: get_translation_progress(lang, cache) for lang in langs}
+    cache.save()
+    return progress
+
+
+def list_po_blobs(rev, cwd=None):
+    """Return a dictionary of language to .po blob SHA at a Git revision"""
+    cmd = ['git', 'ls-tree', rev, 'po/']
+    output = subprocess.check_output(cmd, cwd=cwd or dir_bb_root, encoding='utf-8')
+    blobs = {}
+    for line in output.splitlines():
+        # 100644 blob <sha>\tpo/de.po
+        (info, _tab, path) = line.partition('\t')
+        (_mode, obj_type, sha) = info.split()
+        if obj_type == 'blob' and path.endswith('.po'):
+            blobs[os.path.basename(path)[:-3]] = sha
+    return blobs
+
+
+def iter_blobs(shas, cwd=None):
+    """Yield (SHA, content) for Git blobs using one git cat-file process"""
+    cmd = ['git', 'cat-file', '--batch']
+    with subprocess.Popen(cmd, cwd=cwd or dir_bb_root,
+                          stdin=subprocess.PIPE, stdout=subprocess.PIPE) as proc:
+        for sha in shas:
+            proc.stdin.write(sha.encode() + b'\n')
+            proc.stdin.flush()
+            # <sha> blob <size>
+            header = proc.stdout.readline().split()
+            if len(header) != 3:
+                raise ValueError('cannot read blob %s: %r' % (sha, header))
+            content = proc.stdout.read(int(header[2]))
+            proc.stdout.read(1)  # newline after the content
+            yield (sha, content)
+        proc.stdin.close()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def get_history_progress(revs, cache, cwd=None):
+    """Get the progress for every translation at each Git revision
+
+    The .po files are read from Git objects without a checkout. They
+    are counted as committed and not refreshed against the template of
+    their time, so untranslated messages may be under-counted. A blob
+    that is unchanged between revisions is parsed once.
+
+    Returns a dictionary of revision to a dictionary of language to progress.
+    """
+    blobs_by_rev = {rev: list_po_blobs(rev, cwd) for rev in revs}
+    todo = sorted({sha for blobs in blobs_by_rev.values() for sha in blobs.values()}
+                  - set(cache.blobs))
+    for (sha, content) in iter_blobs(todo, cwd):
+        lines = content.decode('utf-8', errors='replace').splitlines()
+        cache.put_blob_counts(sha, count_po_messages(lines))
+    return {rev: {lang: format_progress(cache.blobs[sha]) for (lang, sha) in blobs.items()}
+            for (rev, blobs) in blobs_by_rev.items()}
+
+
+def history_main(revs):
+    """Print a table of the progress of each translation at each revision"""
+    import bleachbit.Language
+    cache = StatsCache()
+    history = get_history_progress(revs, cache)
+    cache.save()
+    langids = sorted({lang for progress in history.values() for lang in progress})
+    print ("""
+<html>
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+</head>
+<body>
+""")
+    print ('<table>\n')
+    print('<tr><td>Code</td><td>Name</td>%s</tr>\n' %
+          ''.join('<td>%s</td>' % rev for rev in revs))
+    for langid in langids:
+        print('<tr lang="%s">' % (langid))
+        print('<td>%s</td>' % langid)
+        print('<td>%s</td>' % bleachbit.Language.native_locale_names.get(langid, '&nbsp;'))
+        for rev in revs:
+            print('<td>%s</td>' % history[rev].get(langid, '&nbsp;'))
+        print('</tr>')
+    print('</table>')
 
 
 def main():
+    import setup
+    import bleachbit.Language
     print ("""
 <html>
 <head>
@@ -74,7 +295,9 @@ def main():
 """)
     print ('<table>\n')
     print(('<tr><td>Code</td><td>Name</td><td>Percentage translated</td><td>"%s"</td></tr>\n' % summary_str))
-    for langid in sorted(setup.supported_languages()):
+    langids = sorted(setup.supported_languages())
+    progress = get_all_translation_progress(langids)
+    for langid in langids:
         assert (isinstance(langid, str))
         print('<tr lang="%s">' % (langid))
         native_name = bleachbit.Language.native_locale_names[langid]
@@ -83,7 +306,7 @@ def main():
         lang = gettext.translation(
             'bleachbit', localedir=dir_bb_locale, languages=[langid])
         lang.install()
-        stats = get_translation_progress(langid)
+        stats = progress[langid]
         print('<td>%s</td>' % (stats))
         free_space = lang.gettext(summary_str)
         # print 'free_space =', free_space
@@ -93,4 +316,111 @@ def main():
         print('</tr>')
     print('</table>')
 
-main()
+class TestTranslationStats(unittest.TestCase):
+    """Test counting the messages in .po files"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix='bleachbit-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def count(self, po_text):
+        return count_po_messages(po_text.splitlines(True))
+
+    def test_header_and_obsolete(self):
+        """The header and obsolete entries are not counted"""
+        counts = self.count('''msgid ""
+msgstr ""
+"Project-Id-Version: bleachbit\\n"
+
+#~ msgid "Old"
+#~ msgstr "Alt"
+
+#~ msgid "Gone"
+#~ msgstr ""
+''')
+        self.assertEqual(counts, {'translated': 0, 'fuzzy': 0, 'untranslated': 0})
+        self.assertEqual(format_progress(counts), '100%')
+
+    def test_entries(self):
+        """Fuzzy, msgctxt, multi-line, and plural entries are classified"""
+        counts = self.count('''#, fuzzy
+msgid ""
+msgstr ""
+"Project-Id-Version: bleachbit\\n"
+
+#: bleachbit/GUI.py:1
+msgid "Delete"
+msgstr "Löschen"
+
+#, fuzzy, python-format
+msgid "Fuzzy %s"
+msgstr "Unscharf %s"
+
+#, fuzzy
+msgid "Fuzzy and empty"
+msgstr ""
+
+msgctxt "button"
+msgid ""
+msgstr "Kontext"
+
+msgid ""
+"Multi-line "
+"message"
+msgstr ""
+"Mehrzeilige "
+"Nachricht"
+
+msgid "Untranslated"
+msgstr ""
+
+msgid "Multi-line but empty"
+msgstr ""
+""
+
+msgid "%d file"
+msgid_plural "%d files"
+msgstr[0] "%d Datei"
+msgstr[1] "%d Dateien"
+
+msgid "%d folder"
+msgid_plural "%d folders"
+msgstr[0] "%d Ordner"
+msgstr[1] ""
+''')
+        # translated: Delete, msgctxt, multi-line, full plural
+        # untranslated: fuzzy and empty, Untranslated, empty multi-line, partial plural
+        self.assertEqual(counts, {'translated': 4, 'fuzzy': 1, 'untranslated': 4})
+        self.assertEqual(format_progress(counts), '50%')
+
+    def test_stats_cache(self):
+        """Unchanged files are read from the cache, and changed files are counted again"""
+        from unittest import mock
+        po_path = os.path.join(self.test_dir, 'de.po')
+        cache_path = os.path.join(self.test_dir, 'cache.json')
+        with open(po_path, 'w', encoding='utf-8') as f:
+            f.write('msgid "Delete"\nmsgstr "Löschen"\n')
+        cache = StatsCache(cache_path)
+        expected = {'translated': 1, 'fuzzy': 0, 'untranslated': 0}
+        self.assertEqual(cache.get_counts(po_path), expected)
+        cache.save()
+        cache = StatsCache(cache_path)
+        with mock.patch(__name__ + '.count_po_messages', side_effect=AssertionError):
+            self.assertEqual(cache.get_counts(po_path), expected)
+        self.assertFalse(cache.changed)
+        with open(po_path, 'a', encoding='utf-8') as f:
+            f.write('\nmsgid "Cancel"\nmsgstr ""\n')
+        self.assertEqual(cache.get_counts(po_path),
+                         {'translated': 1, 'fuzzy': 0, 'untranslated': 1})
+        self.assertTrue(cache.changed)
+
+
+if __name__ == '__main__':
+    init_bleachbit()
+    if len(sys.argv) > 2 and sys.argv[1] == '--history':
+        # for example: --history $(git -C ../bleachbit tag --list 'v*')
+        history_main(sys.argv[2:])
+    else:
+        main()